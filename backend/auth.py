@@ -1,6 +1,11 @@
 import jwt
 import os
+import time
+import asyncio
 import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from fastapi import HTTPException, Security, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -17,6 +22,70 @@ ALGORITHM = "HS256"
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# bcrypt work pool size and how many hash/verify calls may wait before new ones get a 429
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", 32))
+
+# Runs bcrypt in worker threads so a login burst doesn't block the event loop.
+# bcrypt releases the GIL while hashing, so threads give real parallelism here.
+class PasswordPool:
+    def __init__(self, max_workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.max_pending = max_pending
+        self.pending = 0  # Only touched from the event loop
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=429, detail="Too many login attempts, please retry", headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self.run(pwd_context.verify, password, hashed_password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+# Small LRU of already-validated token payloads. Entries expire at the token's own
+# "exp" (or after ttl seconds, whichever is sooner), so an expired token is never served.
+class TokenCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # Sync dependencies run in FastAPI's threadpool
+
+    def get(self, token: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return dict(payload)
+
+    def set(self, token: str, payload: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        with self._lock:
+            self._entries[token] = (dict(payload), expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+token_cache = TokenCache()
+
 # Hash password
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -33,8 +102,12 @@ def create_jwt_token(user_id: str):
 
 # Decode JWT token
 def decode_jwt_token(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload["sub"]
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+        token_cache.set(token, payload)
         return payload["sub"]
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import orjson
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+CATALOG_CACHE_ENTRIES = 256
+# How long a worker trusts its copy of the shared version before re-reading it
+VERSION_CHECK_INTERVAL = 0.5
+# Longest a cached page is served; bounds how stale like counts get, since like flushes don't bump
+CATALOG_CACHE_MAX_AGE = 5.0
+VERSION_DOC_ID = "catalog"
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError
+
+
+def encode_json(data) -> bytes:
+    return orjson.dumps(data, default=_default)
+
+
+# Pre-encoded catalog responses keyed by (catalog version, query).
+# Writers bump a version counter stored in Mongo; every worker process re-reads it at most
+# every VERSION_CHECK_INTERVAL seconds, so a write in one worker invalidates the others'
+# cached pages shortly after, and immediately in the writing worker. Pages also expire after
+# max_age so counters written without a bump (likes) show up within a few seconds.
+# The ETag is a hash of the body alone, so an unchanged page keeps its ETag across versions.
+class CatalogCache:
+    def __init__(self, versions, max_entries: int = CATALOG_CACHE_ENTRIES, max_age: float = CATALOG_CACHE_MAX_AGE):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = OrderedDict()  # (version, key) -> (body, etag, cached_at)
+        self.local_version = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._lock = asyncio.Lock()
+
+    async def version(self) -> int:
+        if self.local_version is not None and time.monotonic() - self.checked_at < VERSION_CHECK_INTERVAL:
+            return self.local_version
+        async with self._lock:
+            # Another request may have refreshed it while we waited
+            if self.local_version is None or time.monotonic() - self.checked_at >= VERSION_CHECK_INTERVAL:
+                doc = await self.versions.find_one({"_id": VERSION_DOC_ID})
+                self._set_version(doc["version"] if doc else 0)
+        return self.local_version
+
+    def _set_version(self, version: int):
+        # Never step backwards if a read races a newer local bump
+        if self.local_version is None or version > self.local_version:
+            self.local_version = version
+        self.checked_at = time.monotonic()
+
+    # Call after any write that changes catalog responses
+    async def bump(self):
+        doc = await self.versions.find_one_and_update(
+            {"_id": VERSION_DOC_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._set_version(doc["version"])
+
+    def get(self, version: int, key):
+        entry = self.entries.get((version, key))
+        if entry is None or time.monotonic() - entry[2] > self.max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end((version, key))
+        return entry[:2]
+
+    # Encode data once and remember it; returns (body, etag)
+    def put(self, version: int, key, data) -> tuple:
+        body = encode_json(data)
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self.entries[(version, key)] = (body, etag, time.monotonic())
+        self.entries.move_to_end((version, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return body, etag
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "version": self.local_version or 0}
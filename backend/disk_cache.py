@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Byte budget for cached audio; 0 disables the cache. The LRU index is per process, so it
+# defaults to off when uvicorn runs several workers (WEB_CONCURRENCY) unless set explicitly.
+AUDIO_CACHE_MAX_BYTES = int(os.getenv(
+    "AUDIO_CACHE_MAX_BYTES", 0 if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else 1024 * 1024 * 1024
+))
+PARTIAL_SUFFIX = ".part"  # In-progress fills are <file_id>.<pid>.part
+
+
+# Whether the process that wrote a <file_id>.<pid>.part file is still running
+def _process_alive(partial_name: str) -> bool:
+    pid = partial_name[:-len(PARTIAL_SUFFIX)].rpartition(".")[2]
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+# Read-through LRU cache of GridFS audio files on local disk, keyed by GridFS file id.
+# Files are stored as <directory>/<file_id>; the LRU order is rebuilt from mtimes on startup,
+# and hits touch the mtime so popular songs survive a restart. Entries handed out by acquire()
+# are pinned until release(), so eviction never deletes a file that is still being served.
+# The LRU and byte budget are per process: with several workers each one indexes and evicts
+# on its own, and may delete a file another worker is about to serve, so the cache is meant
+# for single-worker deployments. Partial files carry the writer's pid so a worker starting up
+# only removes those left by processes that are gone.
+class AudioDiskCache:
+    def __init__(self, directory: str, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # file_id -> size, least recently used first
+        self.total_bytes = 0
+        self.inflight = {}  # file_id -> task filling that file
+        self.pins = {}  # file_id -> responses currently reading it
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fill_errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(PARTIAL_SUFFIX):
+                if not _process_alive(name):
+                    # Interrupted fill from a previous run
+                    os.remove(path)
+                continue
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path(self, file_id: str) -> str:
+        if not file_id.isalnum():
+            raise ValueError(f"Unexpected file id {file_id!r}")
+        return os.path.join(self.directory, file_id)
+
+    # Return the cached path for file_id and pin it, or None on a miss; pair with release()
+    def acquire(self, file_id: str) -> Optional[str]:
+        if file_id not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(file_id)
+        path = self.path(file_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Removed behind our back; forget it
+            self.total_bytes -= self.entries.pop(file_id)
+            self.hits -= 1
+            self.misses += 1
+            return None
+        self.pins[file_id] = self.pins.get(file_id, 0) + 1
+        return path
+
+    def release(self, file_id: str):
+        count = self.pins.get(file_id, 0) - 1
+        if count > 0:
+            self.pins[file_id] = count
+            return
+        self.pins.pop(file_id, None)
+        # Catch up on evictions skipped while the file was pinned
+        self._evict()
+
+    # Start downloading file_id into the cache without waiting for it; the request that missed
+    # is served from GridFS meanwhile. Concurrent misses for the same file share one download.
+    def fill_in_background(self, file_id: str, length: int, open_stream) -> None:
+        if not self.enabled or length > self.max_bytes:
+            return
+        if file_id in self.entries or file_id in self.inflight:
+            return
+        task = asyncio.create_task(self._download(file_id, open_stream))
+        self.inflight[file_id] = task
+        task.add_done_callback(lambda t: self._fill_done(file_id, t))
+
+    def _fill_done(self, file_id: str, task: asyncio.Task):
+        self.inflight.pop(file_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Audio cache fill failed for %s: %s", file_id, task.exception())
+
+    # Cancel fills still running at shutdown; their partial files are removed
+    async def stop(self):
+        tasks = list(self.inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _download(self, file_id: str, open_stream) -> str:
+        loop = asyncio.get_running_loop()
+        path = self.path(file_id)
+        partial = f"{path}.{os.getpid()}{PARTIAL_SUFFIX}"
+        grid_out = await open_stream()
+        size = 0
+        try:
+            fh = await loop.run_in_executor(None, open, partial, "wb")
+            try:
+                while True:
+                    data = await grid_out.readchunk()
+                    if not data:
+                        break
+                    size += len(data)
+                    await loop.run_in_executor(None, fh.write, data)
+            finally:
+                await loop.run_in_executor(None, fh.close)
+            os.replace(partial, path)
+        except BaseException:
+            self.fill_errors += 1
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            grid_out.close()
+
+        self.entries[file_id] = size
+        self.total_bytes += size
+        self._evict(keep=file_id)
+        return path
+
+    def _evict(self, keep: Optional[str] = None):
+        for file_id, size in list(self.entries.items()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if file_id == keep or file_id in self.pins:
+                continue
+            del self.entries[file_id]
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(file_id))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "fill_errors": self.fill_errors,
+            "files": len(self.entries),
+            "pinned": len(self.pins),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
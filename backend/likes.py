@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Default flush cadence and the longest a single bulk_write may take
+FLUSH_INTERVAL = 1.0
+FLUSH_TIMEOUT = 5.0
+# Recent batch ids remembered per song so a retried batch is applied at most once
+APPLIED_BATCHES_KEPT = 32
+# Final flush attempts on shutdown before buffered counts are given up
+STOP_FLUSH_ATTEMPTS = 3
+
+
+# Buffers like/unlike increments per song and writes them with one bulk_write per interval,
+# so a burst of clicks on a hot song becomes a single $inc instead of one update per click.
+# Every batch carries an id that is pushed onto the song's like_batches in the same update,
+# and the update only matches songs that don't have it yet. A batch whose write failed or
+# timed out (the write may still land) is retried unchanged, so it is applied exactly once.
+class LikeAggregator:
+    def __init__(self, collection, flush_interval: float = FLUSH_INTERVAL, flush_timeout: float = FLUSH_TIMEOUT):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.flush_timeout = flush_timeout
+        self.pending = defaultdict(int)
+        self._failed = None  # (batch_id, batch) awaiting retry
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, song_id, delta: int = 1):
+        self.pending[song_id] += delta
+
+    async def _write(self, batch_id, batch) -> bool:
+        ops = [
+            UpdateOne(
+                {"_id": song_id, "like_batches": {"$ne": batch_id}},
+                {
+                    "$inc": {"likes": delta},
+                    "$push": {"like_batches": {"$each": [batch_id], "$slice": -APPLIED_BATCHES_KEPT}},
+                },
+            )
+            for song_id, delta in batch.items()
+        ]
+        try:
+            await asyncio.wait_for(self.collection.bulk_write(ops, ordered=False), self.flush_timeout)
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            # Includes partial BulkWriteErrors; songs that already have batch_id are skipped on retry
+            logger.warning("Like flush failed, will retry batch %s for %d songs: %s", batch_id, len(ops), e)
+            return False
+        return True
+
+    async def flush(self):
+        async with self._flush_lock:
+            written = 0
+            if self._failed is not None:
+                # Retry the failed batch before taking new counts; they keep accumulating meanwhile
+                batch_id, batch = self._failed
+                if not await self._write(batch_id, batch):
+                    return 0
+                self._failed = None
+                written += len(batch)
+            batch = {song_id: delta for song_id, delta in self.pending.items() if delta}
+            self.pending = defaultdict(int)
+            if batch:
+                batch_id = ObjectId()
+                # Record the batch before writing so a cancelled write is retried, not lost
+                self._failed = (batch_id, batch)
+                if not await self._write(batch_id, batch):
+                    return written
+                self._failed = None
+                written += len(batch)
+        return written
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    # Stop the periodic flush and drain whatever is still buffered
+    async def stop(self):
+        if self._task is not None:
+            # Cancel between flushes, never in the middle of one
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _ in range(STOP_FLUSH_ATTEMPTS):
+            await self.flush()
+            if self._failed is None and not self.pending:
+                return
+            await asyncio.sleep(self.flush_interval)
+        unflushed = dict(self.pending)
+        if self._failed is not None:
+            for song_id, delta in self._failed[1].items():
+                unflushed[song_id] = unflushed.get(song_id, 0) + delta
+        logger.error("Giving up on like counts for %d songs after %d flush attempts: %s",
+                     len(unflushed), STOP_FLUSH_ATTEMPTS, unflushed)
@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import ReturnDocument
+
+from backend.uploads import sniff_audio_format
+
+logger = logging.getLogger(__name__)
+
+PEAK_COUNT = 1000  # Waveform resolution stored per song
+SEEK_TABLE_MAX_ENTRIES = 1000  # One entry per second, thinned out for long files
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+JOB_LEASE = timedelta(minutes=5)  # A running job whose worker died is retried after this
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_INTERVAL = 5.0
+
+# MPEG audio header tables, indexed [version][layer][bitrate_index] (kbps)
+_BITRATES = {
+    1: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    2: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+_VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+
+
+# Decode a 4-byte MPEG audio frame header; None if it isn't one
+def _mp3_frame_header(data: bytes, pos: int):
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = _VERSIONS.get((b1 >> 3) & 0b11)
+    layer = _LAYERS.get((b1 >> 1) & 0b11)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0b11
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _BITRATES[1 if version == 1 else 2][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 2 or version == 1:
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+    return {
+        "version": version,
+        "layer": layer,
+        "crc": not (b1 & 1),
+        "channels": 1 if (b3 >> 6) == 0b11 else 2,
+        "sample_rate": sample_rate,
+        "length": length,
+        "samples": samples,
+    }
+
+
+# Layer III side info: global_gain of every granule/channel, as a loudness proxy
+# (the decoder scales each granule by 2 ** ((global_gain - 210) / 4)).
+def _layer3_gain(data: bytes, pos: int, header: dict) -> float:
+    start = pos + 4 + (2 if header["crc"] else 0)
+    channels = header["channels"]
+    if header["version"] == 1:
+        side_len = 17 if channels == 1 else 32
+        skip = 9 + (5 if channels == 1 else 3) + 4 * channels
+        granules, granule_bits = 2, 59
+    else:
+        side_len = 9 if channels == 1 else 17
+        skip = 8 + (1 if channels == 1 else 2)
+        granules, granule_bits = 1, 63
+    side = data[start:start + side_len]
+    if len(side) < side_len:
+        return 0.0
+    bits = int.from_bytes(side, "big")
+    total_bits = side_len * 8
+    loudest = 0.0
+    for i in range(granules * channels):
+        offset = skip + i * granule_bits
+        part2_3_length = (bits >> (total_bits - offset - 12)) & 0xFFF
+        global_gain = (bits >> (total_bits - offset - 29)) & 0xFF
+        if part2_3_length:  # No coded bits means a silent granule
+            loudest = max(loudest, 2.0 ** ((global_gain - 210) / 4))
+    return loudest
+
+
+def _is_vbr_info_frame(data: bytes, pos: int, header: dict) -> bool:
+    start = pos + 4 + (2 if header["crc"] else 0)
+    if header["version"] == 1:
+        side_len = 17 if header["channels"] == 1 else 32
+    else:
+        side_len = 9 if header["channels"] == 1 else 17
+    return data[start + side_len:start + side_len + 4] in (b"Xing", b"Info") or data[pos + 36:pos + 40] == b"VBRI"
+
+
+def _skip_id3(data: bytes) -> int:
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+# Normalise an amplitude envelope into PEAK_COUNT max-buckets of uint8
+def downsample_peaks(envelope: np.ndarray, count: int = PEAK_COUNT) -> bytes:
+    n = len(envelope)
+    if n == 0:
+        return b""
+    count = min(count, n)
+    edges = np.linspace(0, n, count + 1).astype(np.int64)[:-1]
+    peaks = np.maximum.reduceat(envelope, edges)
+    top = peaks.max()
+    if top <= 0:
+        return bytes(count)
+    return np.round(peaks / top * 255).astype(np.uint8).tobytes()
+
+
+def analyse_mp3(data: bytes) -> dict:
+    pos = _skip_id3(data)
+    offsets, samples, gains = [], [], []
+    first = None
+    end = pos
+    while pos + 4 <= len(data):
+        header = _mp3_frame_header(data, pos)
+        if header is None or (first and header["sample_rate"] != first["sample_rate"]) or header["length"] < 4:
+            # Lost sync: scan for the next candidate frame
+            pos = data.find(b"\xff", pos + 1)
+            if pos < 0:
+                break
+            continue
+        if first is None:
+            # Confirm the first frame by checking the one after it, to avoid false syncs
+            following = pos + header["length"]
+            if following + 4 <= len(data) and _mp3_frame_header(data, following) is None:
+                pos += 1
+                continue
+            first = header
+            if _is_vbr_info_frame(data, pos, header):
+                pos += header["length"]
+                continue
+        offsets.append(pos)
+        samples.append(header["samples"])
+        gains.append(_layer3_gain(data, pos, header) if header["layer"] == 3 else 0.0)
+        pos += header["length"]
+        end = min(pos, len(data))
+
+    if not offsets:
+        raise ValueError("No MPEG audio frames found")
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    samples = np.asarray(samples, dtype=np.int64)
+    sample_rate = first["sample_rate"]
+    start_times = (np.cumsum(samples) - samples) / sample_rate
+    duration = float(samples.sum() / sample_rate)
+    audio_bytes = int(end - offsets[0])
+
+    # Time -> byte offset of the frame playing at that time
+    step = max(1.0, duration / SEEK_TABLE_MAX_ENTRIES)
+    targets = np.arange(0.0, duration, step)
+    index = np.searchsorted(start_times, targets, side="right") - 1
+    seek_table = [[round(float(t), 3), int(o)] for t, o in zip(targets, offsets[index])]
+
+    return {
+        "format": "mp3",
+        "duration": round(duration, 3),
+        "bitrate": int(audio_bytes * 8 / duration) if duration else 0,
+        "sample_rate": sample_rate,
+        "channels": first["channels"],
+        "frames": len(offsets),
+        "seek_table": seek_table,
+        "peaks": downsample_peaks(np.asarray(gains, dtype=np.float64)),
+    }
+
+
+def analyse_wav(data: bytes) -> dict:
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack_from("<HHIIHH", data, body)
+            if audio_format == 0xFFFE and size >= 26:
+                # WAVE_FORMAT_EXTENSIBLE: real format is the start of the SubFormat GUID
+                audio_format = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (audio_format, channels, sample_rate, byte_rate, block_align, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            size = min(size, len(data) - body)  # Streamed WAVs may carry a bogus size
+            return _analyse_pcm(data[body:body + size], body, *fmt)
+        pos = body + size + (size & 1)
+    raise ValueError("WAV file has no fmt/data chunk")
+
+
+def _analyse_pcm(pcm: bytes, data_offset, audio_format, channels, sample_rate, byte_rate, block_align, bits) -> dict:
+    if not channels or not sample_rate or not block_align:
+        raise ValueError("Invalid WAV fmt chunk")
+    pcm = pcm[:len(pcm) - len(pcm) % block_align]
+    if audio_format == 3 and bits in (32, 64):
+        samples = np.frombuffer(pcm, dtype="<f4" if bits == 32 else "<f8").astype(np.float64)
+    elif audio_format == 1 and bits == 8:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif audio_format == 1 and bits == 16:
+        samples = np.frombuffer(pcm, dtype="<i2") / 32768.0
+    elif audio_format == 1 and bits == 24:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(values & 0x800000, values - 0x1000000, values) / 8388608.0
+    elif audio_format == 1 and bits == 32:
+        samples = np.frombuffer(pcm, dtype="<i4") / 2147483648.0
+    else:
+        samples = None  # Compressed WAV payload: metadata only
+
+    frames = len(pcm) // block_align
+    duration = frames / sample_rate
+    peaks = b""
+    if samples is not None and len(samples):
+        envelope = np.abs(samples.reshape(-1, channels)).max(axis=1)
+        peaks = downsample_peaks(envelope)
+    return {
+        "format": "wav",
+        "duration": round(duration, 3),
+        "bitrate": byte_rate * 8,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits_per_sample": bits,
+        "data_offset": data_offset,  # byte = data_offset + seconds * bitrate / 8
+        "peaks": peaks,
+    }
+
+
+# Entry point for the worker processes; must stay picklable (module-level, bytes in, dict out)
+def analyse_audio(data: bytes) -> dict:
+    audio_format = sniff_audio_format(data[:12])
+    if audio_format == "wav":
+        return analyse_wav(data)
+    if audio_format == "mp3":
+        return analyse_mp3(data)
+    raise ValueError("Unsupported audio format")
+
+
+# Durable post-upload job queue kept in Mongo. Jobs are claimed with an atomic
+# find_one_and_update and a lease, so several app workers can share the queue and a job
+# abandoned by a crashed process is picked up again once its lease runs out.
+# CPU work runs in a process pool so it never blocks the event loop.
+class MediaJobQueue:
+    def __init__(self, jobs, load_file, save_result, workers: int = MEDIA_WORKERS):
+        self.jobs = jobs
+        self.load_file = load_file  # async (file_id) -> bytes
+        self.save_result = save_result  # async (song_id, result) -> None
+        self.workers = workers
+        self.executor = None
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    async def ensure_indexes(self):
+        await self.jobs.create_index("song_id", unique=True)
+        await self.jobs.create_index([("status", 1), ("available_at", 1)])
+
+    # Queue a job for song_id unless one exists; retry_failed also re-queues a job that gave up
+    async def enqueue(self, song_id, file_id, retry_failed: bool = False):
+        now = datetime.utcnow()
+        await self.jobs.update_one(
+            {"song_id": song_id},
+            {"$setOnInsert": {
+                "song_id": song_id, "file_id": file_id, "status": "queued",
+                "attempts": 0, "created_at": now, "available_at": now,
+            }},
+            upsert=True,
+        )
+        if retry_failed:
+            await self.jobs.update_one(
+                {"song_id": song_id, "status": "failed"},
+                {"$set": {"file_id": file_id, "status": "queued", "attempts": 0, "available_at": now},
+                 "$unset": {"error": ""}},
+            )
+        self._wakeup.set()
+
+    async def claim(self):
+        now = datetime.utcnow()
+        return await self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "available_at": {"$lte": now}},  # Expired lease
+            ]},
+            {"$set": {"status": "running", "available_at": now + JOB_LEASE}, "$inc": {"attempts": 1}},
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def process(self, job):
+        try:
+            data = await self.load_file(job["file_id"])
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, analyse_audio, data)
+            await self.save_result(job["song_id"], result)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job straight back
+            await self.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "queued", "available_at": datetime.utcnow()}})
+            raise
+        except Exception as e:
+            logger.warning("Media job for song %s failed (attempt %d): %s", job["song_id"], job["attempts"], e)
+            failed = job["attempts"] >= JOB_MAX_ATTEMPTS
+            await self.jobs.update_one({"_id": job["_id"]}, {"$set": {
+                "status": "failed" if failed else "queued",
+                "available_at": datetime.utcnow() + timedelta(seconds=30 * job["attempts"]),
+                "error": str(e),
+            }})
+            return
+        await self.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "done", "finished_at": datetime.utcnow()}, "$unset": {"error": ""}})
+
+    # Process jobs until none are left; returns how many ran
+    async def drain(self) -> int:
+        processed = 0
+        while (job := await self.claim()) is not None:
+            await self.process(job)
+            processed += 1
+        return processed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Media job queue error")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.executor is None:
+            # spawn, not fork: the parent has driver and executor threads running
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
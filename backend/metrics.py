@@ -0,0 +1,196 @@
+import bisect
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Requests slower than this (ms) get a stack profile logged; 0 disables the profiler
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", 0))
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+
+
+# Process-local metric store rendered in the Prometheus text format.
+# Updates are plain dict/int operations on the event loop; the Mongo listener runs on
+# driver threads, so it takes the lock.
+class Metrics:
+    def __init__(self):
+        self.request_latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))  # (method, route, status)
+        self.response_bytes = defaultdict(int)  # (method, route)
+        self.in_flight = defaultdict(int)  # method
+        self.mongo_latency = defaultdict(lambda: Histogram(MONGO_BUCKETS))  # (command, outcome)
+        self.collectors = []  # callables returning {metric_name: value} for extra gauges
+        self.counter_collectors = []  # same, for cumulative counts; exported as <name>_total counters
+        self._lock = threading.Lock()
+
+    def observe_mongo(self, command: str, outcome: str, seconds: float):
+        with self._lock:
+            self.mongo_latency[(command, outcome)].observe(seconds)
+
+    def render(self) -> str:
+        lines = []
+
+        def histogram(name, help_text, series, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(series.items()):
+                labels = _labels(**dict(zip(label_names, key)))
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.total}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        histogram("http_request_duration_seconds", "Time from request start to last response byte.",
+                  self.request_latency, ("method", "route", "status"))
+
+        lines.append("# HELP http_response_bytes_total Response body bytes sent, including streamed audio.")
+        lines.append("# TYPE http_response_bytes_total counter")
+        for (method, route), value in sorted(self.response_bytes.items()):
+            lines.append(f"http_response_bytes_total{{{_labels(method=method, route=route)}}} {value}")
+
+        lines.append("# HELP http_requests_in_flight Requests currently being handled.")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        for method, value in sorted(self.in_flight.items()):
+            lines.append(f"http_requests_in_flight{{{_labels(method=method)}}} {value}")
+
+        with self._lock:
+            mongo = dict(self.mongo_latency)
+        histogram("mongo_command_duration_seconds", "Driver-reported MongoDB command latency.",
+                  mongo, ("command", "outcome"))
+
+        for collect in self.collectors:
+            for name, value in collect().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        for collect in self.counter_collectors:
+            for name, value in collect().items():
+                lines.append(f"# TYPE {name}_total counter")
+                lines.append(f"{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+# pymongo command monitoring; register with the client via event_listeners=[...]
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.observe_mongo(event.command_name, "success", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.metrics.observe_mongo(event.command_name, "failure", event.duration_micros / 1e6)
+
+
+# Samples the event loop thread's stack while enabled. When a request runs longer than the
+# threshold, the samples taken during it are folded and logged. Requests share the loop, so
+# a profile shows everything the loop did while the slow request was in flight.
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms: float, interval: float = PROFILE_SAMPLE_INTERVAL, max_samples: int = 20000):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.samples = collections.deque(maxlen=max_samples)
+        self._thread_id = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread_id is None:
+            self._thread_id = threading.get_ident()
+            threading.Thread(target=self._sample, name="slow-request-profiler", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and len(stack) < 64:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def report(self, label: str, start: float, end: float, top: int = 5):
+        if end - start < self.threshold:
+            return
+        counts = collections.Counter(stack for ts, stack in list(self.samples) if start <= ts <= end)
+        if not counts:
+            return
+        total = sum(counts.values())
+        lines = [f"{n / total:5.1%} {stack}" for stack, n in counts.most_common(top)]
+        logger.warning("Slow request %s took %.0f ms; top stacks:\n%s", label, (end - start) * 1000, "\n".join(lines))
+
+
+# Pure ASGI middleware: unlike @app.middleware("http") it does not re-wrap streamed
+# responses, and it sees every body chunk, so streamed audio bytes are counted too.
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics, profiler: SlowRequestProfiler = None):
+        self.app = app
+        self.metrics = metrics
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        sent = 0
+        start = time.perf_counter()
+        self.metrics.in_flight[method] += 1
+        if self.profiler is not None:
+            self.profiler.start()
+
+        async def send_wrapper(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            self.metrics.in_flight[method] -= 1
+            # Route template, not the raw path, to keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.request_latency[(method, route, status)].observe(end - start)
+            self.metrics.response_bytes[(method, route)] += sent
+            if self.profiler is not None:
+                self.profiler.report(f"{method} {route}", start, end)
@@ -0,0 +1,43 @@
+from fastapi import HTTPException
+
+
+# Parse a single "bytes=" range against the file length.
+# Returns (start, end) inclusive, None to serve the whole file, or raises 416.
+def parse_range_header(range_header: str, length: int):
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None  # Unknown unit or multipart range: ignore and send full body
+    start_str, sep, end_str = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_str == "":
+            # Suffix range: last N bytes
+            suffix = int(end_str)
+            if suffix <= 0:
+                raise ValueError
+            start, end = max(length - suffix, 0), length - 1
+        else:
+            start = int(start_str)
+            if end_str:
+                end = int(end_str)
+                if end < start:
+                    return None  # Invalid spec (RFC 7233 2.1): ignore the header
+                end = min(end, length - 1)
+            else:
+                end = length - 1
+    except ValueError:
+        return None
+    if start < 0 or start >= length:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"},
+        )
+    return start, end
+
+
+def etag_matches(header_value: str, etag: str) -> bool:
+    if header_value.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in header_value.split(",")]
@@ -0,0 +1,290 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import operator
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import timedelta
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Score weight of a match in each field
+FIELD_WEIGHTS = {"title": 3.0, "artist": 2.0, "genre": 1.0}
+# How many vocabulary terms the last (partially typed) query word may expand to, most frequent first
+MAX_PREFIX_EXPANSIONS = 50
+# Entries per term kept pre-ranked for single-word prefix queries, which only need the best matches
+TERM_TOP_ENTRIES = 100
+# Upper bound on index entries scanned per autocomplete request
+MAX_SUGGESTION_SCAN = 5000
+SEARCH_SYNC_INTERVAL = 30.0
+SYNC_BATCH_SIZE = 5000
+# Each sync re-reads songs whose _id timestamp is this close to the last one seen
+SYNC_OVERLAP_SECONDS = 60
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall(normalize(text))
+
+
+# In-process inverted index over song title/artist/genre.
+# Songs are only ever appended to the catalog, so sync() catches up by _id. ObjectIds minted
+# by different processes in the same second don't sort by insert time, and an insert can commit
+# after a later id was read, so each sync re-scans SYNC_OVERLAP_SECONDS behind the last id seen;
+# a song inserted more than that after its _id was generated can still be missed until restart.
+class SongSearchIndex:
+    def __init__(self):
+        self.songs = {}  # song_id -> {"_id", "title", "artist", "genre", "filename"}
+        self.postings = defaultdict(dict)  # term -> {song_id: weight}
+        self.top_entries = {}  # term -> highest-weight (song_id, weight) pairs, once a posting outgrows them
+        self.expansions = {}  # prefix -> _expand_prefix() result, cleared whenever songs are added
+        self.terms = []  # sorted vocabulary, for prefix expansion
+        self.phrases = {}  # (field, normalized value) -> {"text", "field", "count"}
+        self.phrase_keys = []  # sorted suffixes of phrase words, one per word start
+        self.phrase_refs = []  # phrase dict for each entry of phrase_keys
+        self.last_id = None
+        self._task = None
+
+    def __len__(self):
+        return len(self.songs)
+
+    def add(self, song: dict):
+        self._index(song, keep_sorted=True)
+
+    # Index many songs at once: append everything, then sort the lookup lists once
+    def add_many(self, songs: list):
+        for song in songs:
+            self._index(song, keep_sorted=False)
+        self.terms.sort()
+        order = sorted(range(len(self.phrase_keys)), key=self.phrase_keys.__getitem__)
+        self.phrase_keys = [self.phrase_keys[i] for i in order]
+        self.phrase_refs = [self.phrase_refs[i] for i in order]
+
+    def _index(self, song: dict, keep_sorted: bool):
+        song_id = str(song["_id"])
+        if song_id in self.songs:
+            return
+        entry = {
+            "_id": song_id,
+            "title": song.get("title", "Untitled"),
+            "artist": song.get("artist", "Unknown Artist"),
+            "genre": song.get("genre", "Unknown Genre"),
+            "filename": song.get("filename", "Unknown Filename"),
+        }
+        self.songs[song_id] = entry
+        self.expansions.clear()
+
+        for field, weight in FIELD_WEIGHTS.items():
+            words = tokenize(entry[field])
+            for term in words:
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term]
+                    if keep_sorted:
+                        bisect.insort(self.terms, term)
+                    else:
+                        self.terms.append(term)
+                posting[song_id] = posting.get(song_id, 0.0) + weight
+                top = self.top_entries.get(term)
+                if top is not None:
+                    self._update_top_entries(top, song_id, posting[song_id])
+                elif len(posting) > TERM_TOP_ENTRIES:
+                    # Posting just outgrew its top list; rank it once, then maintain incrementally
+                    self.top_entries[term] = heapq.nlargest(
+                        TERM_TOP_ENTRIES, posting.items(), key=operator.itemgetter(1)
+                    )
+            self._add_phrase(field, entry[field], words, keep_sorted)
+
+    def _add_phrase(self, field: str, text: str, words: list, keep_sorted: bool):
+        if not words:
+            return
+        value = " ".join(words)
+        phrase = self.phrases.get((field, value))
+        if phrase is not None:
+            phrase["count"] += 1
+            return
+        phrase = self.phrases[(field, value)] = {"text": text, "field": field, "count": 1}
+        # Index every word start so "beat" suggests "The Beatles"
+        for i in range(len(words)):
+            key = " ".join(words[i:])
+            if keep_sorted:
+                pos = bisect.bisect_right(self.phrase_keys, key)
+                self.phrase_keys.insert(pos, key)
+                self.phrase_refs.insert(pos, phrase)
+            else:
+                self.phrase_keys.append(key)
+                self.phrase_refs.append(phrase)
+
+    def _expand_prefix(self, prefix: str) -> list:
+        expansion = self.expansions.get(prefix)
+        if expansion is not None:
+            return expansion
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff", start)
+        expansion = self.terms[start:end]
+        if len(expansion) > MAX_PREFIX_EXPANSIONS:
+            # Keep the completions that match the most songs, plus the word itself if it is a term
+            exact = [prefix] if expansion[0] == prefix else []
+            completions = expansion[len(exact):]
+            expansion = exact + heapq.nlargest(
+                MAX_PREFIX_EXPANSIONS - len(exact), completions, key=lambda term: len(self.postings[term])
+            )
+        self.expansions[prefix] = expansion
+        return expansion
+
+    # Best entries of a term's posting; small postings are their own top list
+    def _top_entries(self, term: str):
+        top = self.top_entries.get(term)
+        return top if top is not None else self.postings[term].items()
+
+    @staticmethod
+    def _update_top_entries(top: list, song_id: str, weight: float):
+        if len(top) >= TERM_TOP_ENTRIES and weight <= top[-1][1]:
+            return
+        for i, (entry_id, _) in enumerate(top):
+            if entry_id == song_id:
+                del top[i]
+                break
+        pos = len(top)
+        while pos and top[pos - 1][1] < weight:
+            pos -= 1
+        top.insert(pos, (song_id, weight))
+        del top[TERM_TOP_ENTRIES:]
+
+    # (posting, factor) for each vocabulary term the last query word may stand for
+    def _prefix_postings(self, word: str, total: int) -> list:
+        postings = []
+        for term in self._expand_prefix(word):
+            posting = self.postings.get(term)
+            if posting:
+                # Exact word matches rank above prefix completions
+                boost = 1.0 if term == word else 0.5
+                postings.append((term, posting, math.log(1 + total / len(posting)) * boost))
+        return postings
+
+    # Ranked search; every query word must match, the last one as a prefix
+    def search(self, query: str, limit: int = 20) -> list:
+        words = tokenize(query)
+        if not words:
+            return []
+        total = len(self.songs) or 1
+        expanded = self._prefix_postings(words[-1], total)
+        if not expanded:
+            return []
+
+        if len(words) == 1:
+            # Only the best matches are returned, so merge each term's pre-ranked top entries
+            # instead of whole postings; a short prefix can expand to tens of thousands of songs
+            scores = {}
+            for term, posting, factor in expanded:
+                for song_id, weight in self._top_entries(term):
+                    scores[song_id] = scores.get(song_id, 0.0) + weight * factor
+            top = heapq.nlargest(limit, scores.items(), key=operator.itemgetter(1))
+            return [dict(self.songs[song_id], score=round(score, 4)) for song_id, score in top]
+
+        # Intersect the complete words starting from the rarest, then score only the survivors
+        word_scores = []
+        for word in words[:-1]:
+            posting = self.postings.get(word)
+            if not posting:
+                return []
+            word_scores.append((posting, math.log(1 + total / len(posting))))
+        word_scores.sort(key=lambda ws: len(ws[0]))
+        candidates = set(word_scores[0][0])
+        for mapping, _ in word_scores[1:]:
+            candidates = mapping.keys() & candidates
+            if not candidates:
+                return []
+
+        # Score the partial last word for the survivors, by lookup or by walking the postings,
+        # whichever touches fewer entries
+        last = {}  # song_id -> score, completed with the other words below
+        if len(candidates) * len(expanded) <= sum(len(posting) for _, posting, _ in expanded):
+            for song_id in candidates:
+                score = 0.0
+                for _, posting, factor in expanded:
+                    weight = posting.get(song_id)
+                    if weight:
+                        score += weight * factor
+                if score:
+                    last[song_id] = score
+        else:
+            for _, posting, factor in expanded:
+                for song_id, weight in posting.items():
+                    if song_id in candidates:
+                        last[song_id] = last.get(song_id, 0.0) + weight * factor
+        for mapping, factor in word_scores:
+            for song_id in last:
+                last[song_id] += mapping[song_id] * factor
+        top = heapq.nlargest(limit, last.items(), key=operator.itemgetter(1))
+        return [dict(self.songs[song_id], score=round(score, 4)) for song_id, score in top]
+
+    # Prefix suggestions drawn from title/artist/genre values, most common first
+    def autocomplete(self, prefix: str, limit: int = 10) -> list:
+        prefix = " ".join(tokenize(prefix))
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.phrase_keys, prefix)
+        end = bisect.bisect_left(self.phrase_keys, prefix + "\uffff", start)
+        candidates = self.phrase_refs[start:min(end, start + MAX_SUGGESTION_SCAN)]
+        # A phrase can match at several word starts; over-fetch, then drop repeats
+        suggestions = []
+        for phrase in heapq.nlargest(limit * 3, candidates, key=operator.itemgetter("count")):
+            if all(phrase is not s for s in suggestions):
+                suggestions.append(phrase)
+                if len(suggestions) == limit:
+                    break
+        return [dict(p) for p in suggestions]
+
+    # Pull songs added since the last sync (all of them on the first call)
+    async def sync(self, collection) -> int:
+        query = {}
+        if self.last_id is not None:
+            since = self.last_id.generation_time - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+            query = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+        projection = {"title": 1, "artist": 1, "genre": 1, "filename": 1}
+        before = len(self.songs)
+        batch = []
+        async for song in collection.find(query, projection).sort("_id", 1):
+            # Songs from the overlap window are already indexed; _index() skips them
+            batch.append(song)
+            # Only advance from songs read here; add() from an upload may skip other workers' songs
+            self.last_id = song["_id"]
+            if len(batch) >= SYNC_BATCH_SIZE:
+                self.add_many(batch)
+                batch = []
+        if batch:
+            self.add_many(batch)
+        return len(self.songs) - before
+
+    async def _run(self, collection, interval: float):
+        while True:
+            try:
+                await self.sync(collection)
+            except Exception:
+                logger.exception("Search index sync failed")
+            await asyncio.sleep(interval)
+
+    def start(self, collection, interval: float = SEARCH_SYNC_INTERVAL):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(collection, interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
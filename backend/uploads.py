@@ -0,0 +1,118 @@
+import os
+from collections import deque
+from typing import Optional
+
+from fastapi import HTTPException
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Largest accepted audio file, checked against Content-Length up front and while streaming
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+# Limits on everything that isn't file data: field values plus part headers, and the part count
+MAX_FORM_BYTES = 64 * 1024
+MAX_FORM_PARTS = 16
+SNIFF_BYTES = 12  # Enough to recognise both RIFF/WAVE and MP3 headers
+
+
+# Detect the audio format from the first bytes of the file instead of trusting the extension
+def sniff_audio_format(head: bytes) -> Optional[str]:
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:3] == b"ID3":
+        return "mp3"
+    # Bare MPEG audio frame: 11-bit sync word, layer bits not "reserved"
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0 and (head[1] & 0x06) != 0:
+        return "mp3"
+    return None
+
+
+# Parse a multipart/form-data body incrementally, yielding events as the body arrives:
+#   ("field", name, value), ("file_start", name, filename), ("file_data", bytes), ("file_end",)
+# The next body chunk is only read once the caller has consumed the previous events,
+# so a slow consumer (e.g. GridFS writes) applies backpressure to the client.
+async def iter_multipart(chunks, content_type: str):
+    ctype, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if ctype != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    events = deque()
+    part = {}
+    header = {"field": b"", "value": b""}
+    form = {"bytes": 0, "parts": 0, "complete": False}
+
+    def count_form_bytes(size):
+        form["bytes"] += size
+        if form["bytes"] > MAX_FORM_BYTES:
+            raise HTTPException(status_code=413, detail="Form fields too large")
+
+    def on_part_begin():
+        form["parts"] += 1
+        if form["parts"] > MAX_FORM_PARTS:
+            raise HTTPException(status_code=413, detail="Too many form fields")
+        part.clear()
+        part["headers"] = {}
+
+    def on_header_field(data, start, end):
+        count_form_bytes(end - start)
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        count_form_bytes(end - start)
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header["field"].lower()] = header["value"]
+        header["field"], header["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if filename is not None:
+            part["file"] = True
+            events.append(("file_start", part["name"], filename.decode("utf-8", "replace")))
+        else:
+            part["file"] = False
+            part["value"] = bytearray()
+
+    def on_part_data(data, start, end):
+        if part["file"]:
+            events.append(("file_data", bytes(data[start:end])))
+            return
+        count_form_bytes(end - start)
+        part["value"] += data[start:end]
+
+    def on_part_end():
+        if part["file"]:
+            events.append(("file_end",))
+        else:
+            events.append(("field", part["name"], part["value"].decode("utf-8", "replace")))
+
+    def on_end():
+        form["complete"] = True
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+
+    async for chunk in chunks:
+        try:
+            parser.write(chunk)
+        except MultipartParseError:
+            raise HTTPException(status_code=400, detail="Malformed multipart body")
+        while events:
+            yield events.popleft()
+    parser.finalize()
+    if not form["complete"]:
+        # finalize() doesn't check for the closing boundary; a cut-off body would look like a short file
+        raise HTTPException(status_code=400, detail="Incomplete multipart body")
+    while events:
+        yield events.popleft()
@@ -0,0 +1,299 @@
+# End-to-end load test for main.py against a local MongoDB.
+#
+# Starts (or reuses) a local mongod, seeds a synthetic catalog of audio blobs in GridFS,
+# runs the app under uvicorn and drives concurrent workloads against it over HTTP:
+# register, login, upload, full and ranged downloads, catalog listing, likes and comments.
+# Results (throughput, p50/p95/p99 latency, errors, server peak RSS) are written as JSON;
+# passing --baseline compares against a previous results file and exits non-zero on a
+# regression.
+#
+#   pip install -r benchmarks/requirements.txt
+#   python benchmarks/load_bench.py --output bench_results.json
+#   python benchmarks/load_bench.py --baseline bench_results.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from pymongo import MongoClient
+from gridfs import GridFSBucket
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_NAME = "music_hub"  # Fixed in main.py
+PASSWORD = "bench-password"
+GENRES = ["Rock", "Pop", "Jazz", "Blues", "Hip Hop", "Classical", "Electronic", "Folk"]
+WORKLOADS = ["register", "login", "upload", "download_full", "download_range", "list_songs", "like", "comment"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def start_mongod(workdir: str):
+    mongod = shutil.which("mongod")
+    if mongod is None:
+        raise RuntimeError("mongod not found on PATH; install MongoDB or pass --mongo-uri")
+    port = free_port()
+    dbpath = os.path.join(workdir, "db")
+    os.makedirs(dbpath)
+    proc = subprocess.Popen(
+        [mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    uri = f"mongodb://127.0.0.1:{port}"
+    wait_for(lambda: MongoClient(uri, serverSelectionTimeoutMS=500).admin.command("ping"), 30, "mongod")
+    return proc, uri
+
+
+# Bytes that pass upload_music's content sniffing: an ID3 tag followed by MPEG frame syncs
+def synthetic_mp3(rng: random.Random, size: int) -> bytes:
+    body = bytearray(rng.getrandbits(8) for _ in range(min(size, 4096)))
+    body = (bytes(body) * (size // len(body) + 1))[:size - 10]
+    return b"ID3\x04\x00\x00\x00\x00\x00\x00" + body
+
+
+def seed(uri: str, songs: int, song_bytes: int, users: int, rng: random.Random):
+    client = MongoClient(uri)
+    client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    bucket = GridFSBucket(db)
+    docs = []
+    for i in range(songs):
+        file_id = bucket.upload_from_stream(f"seed-{i}.mp3", synthetic_mp3(rng, song_bytes))
+        docs.append({
+            "file_id": file_id,
+            "filename": f"{file_id}.mp3",
+            "title": f"Seed Song {i}",
+            "artist": f"Artist {i % 50}",
+            "genre": rng.choice(GENRES),
+            "likes": 0,
+            "comment_count": 0,
+        })
+    db.music.insert_many(docs)
+    client.close()
+    return [(str(d["_id"]), d["filename"]) for d in docs], [f"seed-user-{i}" for i in range(users)]
+
+
+def start_server(uri: str, workdir: str, port: int):
+    env = dict(os.environ, MONGO_URI=uri, MONGO_TLS="false", SECRET_KEY="bench-secret", LOG_LEVEL="WARNING")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_ROOT,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env,  # uploads/ (the audio cache) is created in the scratch dir
+    )
+    wait_for(lambda: httpx.get(f"http://127.0.0.1:{port}/").status_code == 200, 60, "uvicorn")
+    return proc
+
+
+# Peak resident set size of a process, from /proc (Linux only)
+def peak_rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_workload(name, make_request, count, concurrency):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(count):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await make_request(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    result = {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+    print(f"{name:<15} {result['throughput_rps']:>9.1f} req/s  p50={result['p50_ms']:.1f}ms "
+          f"p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms errors={errors}")
+    return result
+
+
+async def drive(base_url, songs, users, args, rng):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        for username in users:
+            await http.post("/api/register", json={"username": username, "password": PASSWORD})
+        tokens = []
+        for username in users:
+            response = await http.post("/api/login", json={"username": username, "password": PASSWORD})
+            tokens.append(response.json()["access_token"])
+
+        def auth(i):
+            return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+        run_id = f"{time.time_ns():x}"
+        song_bytes = args.song_bytes
+
+        def ranged(i):
+            start = rng.randrange(0, song_bytes - args.range_bytes)
+            return {"Range": f"bytes={start}-{start + args.range_bytes - 1}"}
+
+        requests = {
+            "register": lambda i: http.post("/api/register", json={"username": f"bench-{run_id}-{i}", "password": PASSWORD}),
+            "login": lambda i: http.post("/api/login", json={"username": users[i % len(users)], "password": PASSWORD}),
+            "upload": lambda i: http.post(
+                "/api/upload", headers=auth(i),
+                data={"title": f"Upload {i}", "artist": "Bench", "genre": rng.choice(GENRES)},
+                files={"file": (f"upload-{i}.mp3", synthetic_mp3(random.Random(f"{run_id}-{i}"), song_bytes), "audio/mpeg")},
+            ),
+            "download_full": lambda i: http.get(f"/api/songs/file/{songs[i % len(songs)][1]}"),
+            "download_range": lambda i: http.get(f"/api/songs/file/{songs[i % len(songs)][1]}", headers=ranged(i)),
+            "list_songs": lambda i: http.get("/api/songs", params={"limit": 50}),
+            "like": lambda i: http.post(f"/api/songs/{songs[i % len(songs)][0]}/like", headers=auth(i)),
+            "comment": lambda i: http.post(f"/api/songs/{songs[i % len(songs)][0]}/comments",
+                                           json={"user": "bench", "comment": f"comment {i}"}),
+        }
+        counts = {"register": args.auth_requests, "login": args.auth_requests, "upload": args.upload_requests}
+
+        results = {}
+        for name in args.workloads:
+            results[name] = await run_workload(name, requests[name], counts.get(name, args.requests), args.concurrency)
+        return results
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, base in baseline["workloads"].items():
+        current = results["workloads"].get(name)
+        if current is None:
+            continue
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            failures.append(f"{name}: throughput {current['throughput_rps']} < baseline {base['throughput_rps']}")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance):
+                failures.append(f"{name}: {key} {current[key]} > baseline {base[key]}")
+        if current["errors"] > base["errors"]:
+            failures.append(f"{name}: errors {current['errors']} > baseline {base['errors']}")
+    if results.get("peak_rss_mb") and baseline.get("peak_rss_mb"):
+        if results["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+            failures.append(f"peak RSS {results['peak_rss_mb']:.1f} MB > baseline {baseline['peak_rss_mb']:.1f} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test main.py against a local MongoDB")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB instead of starting a throwaway mongod (requires --drop-existing)")
+    parser.add_argument("--drop-existing", action="store_true",
+                        help="Confirm that the music_hub db at --mongo-uri may be dropped and reseeded")
+    parser.add_argument("--songs", type=int, default=200, help="Synthetic songs to seed")
+    parser.add_argument("--song-bytes", type=int, default=512 * 1024)
+    parser.add_argument("--range-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per read/like/comment workload")
+    parser.add_argument("--auth-requests", type=int, default=200, help="Requests per register/login workload")
+    parser.add_argument("--upload-requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Fail if results regress against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+    if args.mongo_uri and not args.drop_existing:
+        # main.py hard-codes the music_hub db, so seeding an existing server wipes its catalog
+        parser.error(f"--mongo-uri drops and reseeds the {DB_NAME} database; pass --drop-existing to confirm")
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="music-hub-bench-")
+    mongod = server = None
+    try:
+        uri = args.mongo_uri
+        if uri is None:
+            mongod, uri = start_mongod(workdir)
+        songs, users = seed(uri, args.songs, args.song_bytes, args.users, rng)
+        port = free_port()
+        server = start_server(uri, workdir, port)
+        workloads = asyncio.run(drive(f"http://127.0.0.1:{port}", songs, users, args, rng))
+        results = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "songs": args.songs,
+                "song_bytes": args.song_bytes,
+                "concurrency": args.concurrency,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "workloads": workloads,
+            "peak_rss_mb": peak_rss_mb(server.pid),
+        }
+    finally:
+        for proc in (server, mongod):
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"peak RSS {results['peak_rss_mb']} MB; results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            failures = compare(results, json.load(fh), args.tolerance)
+        if failures:
+            print("Regressions against baseline:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
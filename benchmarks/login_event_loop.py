@@ -0,0 +1,86 @@
+# Measures event-loop latency while many logins verify bcrypt hashes at once.
+#
+# A ticker coroutine asks to wake up every TICK seconds and records how late it actually
+# runs; that lateness is what every concurrent stream/catalog request would also see.
+# The same burst is run with bcrypt called inline (the old login handler) and through
+# PasswordPool (the current one).
+#
+#   python benchmarks/login_event_loop.py --logins 50
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+from backend.auth import PasswordPool, pwd_context
+
+TICK = 0.005
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_burst(label, verify, logins, hashed):
+    lags, stop = [], asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)  # Let the ticker settle
+
+    rejected = 0
+
+    async def one_login():
+        nonlocal rejected
+        try:
+            assert await verify("correct horse", hashed)
+        except HTTPException as e:
+            if e.status_code != 429:
+                raise
+            rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+
+    lags_ms = [lag * 1000 for lag in lags] or [0.0]
+    print(
+        f"{label:<8} logins={logins} rejected={rejected} wall={elapsed:.2f}s "
+        f"loop_lag_ms p50={statistics.median(lags_ms):.1f} "
+        f"p99={percentile(lags_ms, 99):.1f} max={max(lags_ms):.1f}"
+    )
+
+
+async def main(logins, workers, max_pending):
+    hashed = pwd_context.hash("correct horse")
+
+    async def inline_verify(password, hashed_password):
+        return pwd_context.verify(password, hashed_password)
+
+    pool = PasswordPool(max_workers=workers, max_pending=max_pending)
+    try:
+        await run_burst("inline", inline_verify, logins, hashed)
+        await run_burst("pooled", pool.verify, logins, hashed)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop latency during a bcrypt login burst")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.workers, args.max_pending))
@@ -0,0 +1,105 @@
+# Builds SongSearchIndex over a synthetic catalog and reports search/autocomplete latency.
+#
+#   python benchmarks/search_index.py --songs 100000
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from backend.search import SongSearchIndex
+
+GENRES = [
+    "Rock", "Pop", "Jazz", "Blues", "Hip Hop", "Classical", "Electronic", "Country",
+    "Reggae", "Metal", "Folk", "Soul", "Funk", "Punk", "Ambient", "Afrobeat",
+]
+SYLLABLES = ["la", "mo", "ri", "ka", "zen", "tor", "vel", "an", "dra", "si", "qu", "bel", "nox", "ar", "lu", "mi"]
+WORDS = [
+    "love", "night", "dream", "fire", "heart", "river", "shadow", "light", "summer", "rain",
+    "road", "city", "blue", "gold", "storm", "wild", "echo", "ocean", "moon", "stone",
+]
+
+
+def make_word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_catalog(count, seed=0):
+    rng = random.Random(seed)
+    artists = [f"{make_word(rng).title()} {make_word(rng).title()}" for _ in range(max(1, count // 20))]
+    songs = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) if rng.random() < 0.5 else make_word(rng) for _ in range(rng.randint(1, 4))]
+        songs.append({
+            "_id": ObjectId(),
+            "title": " ".join(words).title(),
+            "artist": rng.choice(artists),
+            "genre": rng.choice(GENRES),
+            "filename": "x.mp3",
+        })
+    return songs
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def measure(label, fn, queries):
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        timings.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<13} n={len(queries)} p50={percentile(timings, 50):.2f}ms "
+        f"p95={percentile(timings, 95):.2f}ms p99={percentile(timings, 99):.2f}ms max={max(timings):.2f}ms"
+    )
+
+
+def main(count, queries):
+    songs = make_catalog(count)
+    index = SongSearchIndex()
+    start = time.perf_counter()
+    for i in range(0, len(songs), 5000):
+        index.add_many(songs[i:i + 5000])
+    print(f"indexed {len(index)} songs in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    for song in make_catalog(100, seed=1):
+        index.add(song)
+    print(f"incremental add: {(time.perf_counter() - start) * 10:.2f}ms per song")
+
+    rng = random.Random(2)
+    sample = rng.sample(songs, min(queries, len(songs)))
+    search_queries = []
+    for song in sample:
+        kind = rng.random()
+        word = song["title"].split()[0]
+        if kind < 0.3:
+            search_queries.append(song["title"])
+        elif kind < 0.5:
+            search_queries.append(f"{song['artist'].split()[0]} {song['genre']}")
+        elif kind < 0.65:
+            # Partially typed last word
+            search_queries.append(word[:max(2, len(word) // 2)])
+        elif kind < 0.85:
+            # First keystrokes of as-you-type search
+            search_queries.append(word[:rng.randint(1, 2)])
+        else:
+            search_queries.append(f"{song['artist'].split()[0]} {song['genre'][:rng.randint(1, 2)]}")
+    prefixes = [rng.choice([s["title"], s["artist"], s["genre"]])[:rng.randint(1, 5)] for s in sample]
+
+    measure("search", lambda q: index.search(q, 20), search_queries)
+    measure("autocomplete", lambda q: index.autocomplete(q, 10), prefixes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search index latency on a synthetic catalog")
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.songs, args.queries)
@@ -61,7 +61,7 @@ function MusicUpload() {
       <form onSubmit={handleUpload} className="flex flex-col items-center">
         <input
           type="file"
-          accept=".mp3"
+          accept=".mp3,.wav"
           onChange={handleFileChange}
           className="mb-4"
         />
@@ -8,34 +8,38 @@ function SongList() {
   const [error, setError] = useState(null);
   const [commentInputs, setCommentInputs] = useState({});
 
-  useEffect(() => {
-    const fetchSongs = () => {
-      const token = localStorage.getItem("token");
-      if (!token) {
-        setError("You must be logged in to view songs.");
-        return;
-      }
-
-      axios
-        .get(`${API_URL}/songs`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        })
-        .then((response) => {
-          if (response.data?.songs?.length) {
-            setSongs(response.data.songs);
-          } else {
-            console.warn("No songs returned from API.");
-            setSongs([]);
-          }
-        })
-        .catch((error) => {
-          console.error("Error fetching songs:", error);
-          setError("Error fetching songs. Please try again later.");
-        });
-    };
+  const [nextCursor, setNextCursor] = useState(null);
+
+  // Fetch one page of songs; pass a cursor to append the following page
+  const fetchSongs = (cursor = null) => {
+    const token = localStorage.getItem("token");
+    if (!token) {
+      setError("You must be logged in to view songs.");
+      return;
+    }
+
+    axios
+      .get(`${API_URL}/songs`, {
+        params: { cursor: cursor || undefined },
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      })
+      .then((response) => {
+        const page = response.data?.songs || [];
+        if (!cursor && !page.length) {
+          console.warn("No songs returned from API.");
+        }
+        setSongs((prevSongs) => (cursor ? [...prevSongs, ...page] : page));
+        setNextCursor(response.data?.next_cursor || null);
+      })
+      .catch((error) => {
+        console.error("Error fetching songs:", error);
+        setError("Error fetching songs. Please try again later.");
+      });
+  };
 
+  useEffect(() => {
     fetchSongs();
   }, []);
 
@@ -53,7 +57,9 @@ function SongList() {
           Authorization: `Bearer ${token}`,
         },
       })
-      .then(() => {
+      .then((response) => {
+        // Each user's like only counts once
+        if (!response.data?.changed) return;
         setSongs((prevSongs) =>
           prevSongs.map((song) =>
             song._id === songId ? { ...song, likes: (song.likes || 0) + 1 } : song
@@ -103,10 +109,11 @@ function SongList() {
             song._id === songId
               ? {
                   ...song,
-                  comments: [
-                    ...(song.comments || []),
-                    { username: "Guest", comment: comment }, // Updated to use `.comment`
-                  ],
+                  comment_count: (song.comment_count || 0) + 1,
+                  latest_comments: [
+                    ...(song.latest_comments || []),
+                    { user: "Anonymous", comment: comment },
+                  ].slice(-3),
                 }
               : song
           )
@@ -155,12 +162,12 @@ function SongList() {
 
               {/* Comment section */}
               <div className="mb-2">
-                <h4 className="font-medium mb-1">Comments:</h4>
-                {song.comments && song.comments.length > 0 ? (
+                <h4 className="font-medium mb-1">Comments ({song.comment_count || 0}):</h4>
+                {song.latest_comments && song.latest_comments.length > 0 ? (
                   <div className="space-y-1 mb-2">
-                    {song.comments.map((c, index) => (
+                    {song.latest_comments.map((c, index) => (
                       <p key={index} className="text-sm">
-                        <strong>{c.username}:</strong> {c.comment}
+                        <strong>{c.user}:</strong> {c.comment}
                       </p>
                     ))}
                   </div>
@@ -183,6 +190,16 @@ function SongList() {
               </div>
             </li>
           ))}
+          {nextCursor && (
+            <li className="text-center">
+              <button
+                onClick={() => fetchSongs(nextCursor)}
+                className="px-2 py-1 bg-gray-200 rounded hover:bg-gray-300 transition duration-200"
+              >
+                Load more
+              </button>
+            </li>
+          )}
         </ul>
       ) : (
         <p className="text-center text-gray-500">No songs uploaded yet.</p>
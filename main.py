@@ -1,8 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Response
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from passlib.context import CryptContext
 import jwt
 from jwt import ExpiredSignatureError, InvalidTokenError
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
@@ -13,13 +12,27 @@ from dotenv import load_dotenv
 import certifi 
 from pydantic import BaseModel
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
 import shutil
 import gridfs
+from gridfs.errors import NoFile
 import uuid
+import hashlib
 import bcrypt
-import traceback
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from email.utils import format_datetime
+from backend.auth import PasswordPool, TokenCache
+from backend.catalog_cache import CatalogCache
+from backend.disk_cache import AudioDiskCache
+from backend.likes import LikeAggregator
+from backend.media import MediaJobQueue
+from backend.metrics import SLOW_REQUEST_PROFILE_MS, Metrics, MetricsMiddleware, MongoCommandListener, SlowRequestProfiler
+from backend.ranges import etag_matches, parse_range_header
+from backend.search import SongSearchIndex
+from backend.uploads import MAX_FORM_BYTES, MAX_UPLOAD_BYTES, SNIFF_BYTES, iter_multipart, sniff_audio_format
 
 if not hasattr(bcrypt, '__about__'):
     bcrypt.__about__ = type('about', (object,), {'__version__': bcrypt.__version__})()
@@ -27,6 +40,9 @@ if not hasattr(bcrypt, '__about__'):
 # Load environment variables
 load_dotenv()
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger("music_hub")
+
 # FastAPI app instance
 app = FastAPI()
 
@@ -39,23 +55,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def log_requests(request, call_next):
-    print(f"Incoming request: {request.method} {request.url}")
-    response = await call_next(request)
-    print(f"Response status: {response.status_code}")
-    return response
-
-print("CORS Config:", {
-    "allow_origins": ["http://localhost:3000", "https://gsharp.onrender.com", "https://gsharp1.onrender.com"],
-    "allow_credentials": True,
-    "allow_methods": ["*"],
-    "allow_headers": ["*"]
-})
-
-# Create uploads directory if not exists
+# Per-route latency, in-flight and response byte metrics (outermost, so streamed bodies are counted)
+metrics = Metrics()
+profiler = SlowRequestProfiler(SLOW_REQUEST_PROFILE_MS) if SLOW_REQUEST_PROFILE_MS > 0 else None
+app.add_middleware(MetricsMiddleware, metrics=metrics, profiler=profiler)
+
+# Create uploads directory if not exists; it holds the local audio cache
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+audio_cache = AudioDiskCache(UPLOAD_DIR)
 
 # MongoDB connection
 MONGO_URI = os.getenv("MONGO_URI")
@@ -64,17 +72,27 @@ MONGO_URI = os.getenv("MONGO_URI")
 if not MONGO_URI:
     raise RuntimeError("MONGO_URI environment variable not set. Please add it to your Render environment variables.")
 
-client = AsyncIOMotorClient(MONGO_URI, tlsCAFile=certifi.where())
+# tlsCAFile implies TLS, so it is left out for plain local mongod instances (MONGO_TLS=false)
+mongo_options = {"event_listeners": [MongoCommandListener(metrics)]}
+if os.getenv("MONGO_TLS", "true").lower() != "false":
+    mongo_options["tlsCAFile"] = certifi.where()
+client = AsyncIOMotorClient(MONGO_URI, **mongo_options)
 db = client.music_hub
 fs = AsyncIOMotorGridFSBucket(db)
 users_collection = db.users
 music_collection = db.music
+comments_collection = db.comments
+likes_collection = db.likes
+media_jobs_collection = db.media_jobs
+# Shared catalog version counter; bumped by writes so every worker drops cached pages
+catalog_cache = CatalogCache(db.versions)
 
 # Authentication settings
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_pool = PasswordPool()  # bcrypt runs here, off the event loop
+token_cache = TokenCache()
 
 # Define Models
 class UserLogin(BaseModel):
@@ -105,8 +123,12 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(minutes
 
 # Verify the token
 def verify_token(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.set(token, payload)
         return payload
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -120,13 +142,17 @@ async def register(user: UserRegister):
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
     
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_pool.hash(user.password)
     new_user = {
         "username": user.username,
         "password": hashed_password,
         "role": "user"
     }
-    await users_collection.insert_one(new_user)
+    try:
+        await users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same name (unique index)
+        raise HTTPException(status_code=400, detail="User already exists")
     return {"message": "User registered successfully"}
 
 # Login user
@@ -134,7 +160,7 @@ async def register(user: UserRegister):
 async def login(user: UserLogin):
     try:
         db_user = await users_collection.find_one({"username": user.username})
-        if not db_user or not pwd_context.verify(user.password, db_user["password"]):
+        if not db_user or not await password_pool.verify(user.password, db_user["password"]):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         access_token = create_access_token(data={"sub": user.username})
@@ -142,9 +168,8 @@ async def login(user: UserLogin):
 
     except HTTPException as e:
         raise e  # Forward HTTP errors as-is
-    except Exception as e:
-        print("Login Error:", str(e))
-        print(traceback.format_exc())  # Log the full error traceback
+    except Exception:
+        logger.exception("Login error")  # Log the full error traceback
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 @app.options("/api/login")
@@ -155,10 +180,12 @@ async def preflight():
 async def get_protected_data():
     return {"message": "Protected route"}
 
-# Upload song with metadata
+# Upload song with metadata.
+# The multipart body is streamed straight into GridFS (hashing as it goes) instead of being
+# spooled first; an identical blob that is already stored is reused rather than duplicated.
 @app.post("/api/upload")
 async def upload_music(
-    file: UploadFile = File(...),
+    request: Request,
     title: str = "",
     artist: str = "",
     genre: str = "",
@@ -166,27 +193,128 @@ async def upload_music(
 ):
     verify_token(token)
 
-    file_ext = file.filename.split(".")[-1]
-    if file_ext not in ["mp3", "wav"]:
-        raise HTTPException(status_code=400, detail="Invalid file type")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MAX_FORM_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    fields = {"title": title, "artist": artist, "genre": genre}
+    grid_in = None
+    original_filename = None
+    file_format = None
+    head = b""
+    size = 0
+    digest = hashlib.sha256()
+
+    async def start_blob(data: bytes):
+        nonlocal grid_in, file_format
+        file_format = sniff_audio_format(data)
+        if file_format is None:
+            raise HTTPException(status_code=400, detail="Invalid file type")
+        grid_in = fs.open_upload_stream(original_filename, metadata={"format": file_format})
+        digest.update(data)
+        await grid_in.write(data)
 
-    # Save to GridFS directly without saving locally
-    gridfs_file_id = await fs.upload_from_stream(file.filename, file.file)
+    try:
+        async for event in iter_multipart(request.stream(), request.headers.get("content-type", "")):
+            kind = event[0]
+            if kind == "field":
+                fields[event[1]] = event[2]
+            elif kind == "file_start":
+                if original_filename is not None:
+                    raise HTTPException(status_code=400, detail="Only one file per upload")
+                original_filename = event[2]
+            elif kind == "file_data":
+                data = event[1]
+                size += len(data)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="File too large")
+                if grid_in is not None:
+                    digest.update(data)
+                    await grid_in.write(data)
+                else:
+                    head += data
+                    if len(head) >= SNIFF_BYTES:
+                        await start_blob(head)
+            elif kind == "file_end" and grid_in is None:
+                await start_blob(head)
+
+        if original_filename is None or grid_in is None:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+
+        sha256 = digest.hexdigest()
+        existing = await db["fs.files"].find_one({"sha256": sha256}, {"_id": 1})
+        if existing:
+            # Same bytes already stored: drop the chunks just written and share the blob
+            await grid_in.abort()
+            gridfs_file_id = existing["_id"]
+        else:
+            await grid_in.set("sha256", sha256)
+            await grid_in.close()
+            gridfs_file_id = grid_in._id
+    except BaseException:
+        if grid_in is not None and not grid_in.closed:
+            await grid_in.abort()
+        raise
 
     music_doc = {
         "file_id": gridfs_file_id,
-        "filename": file.filename,
-        "title": title or "Untitled",
-        "artist": artist or "Unknown Artist",
-        "genre": genre or "Unknown Genre"
+        # Stream URL resolves by file id, so deduplicated uploads play the shared blob
+        "filename": f"{gridfs_file_id}.{file_format}",
+        "original_filename": original_filename,
+        "size": size,
+        "sha256": sha256,
+        "title": fields.get("title") or "Untitled",
+        "artist": fields.get("artist") or "Unknown Artist",
+        "genre": fields.get("genre") or "Unknown Genre"
     }
     await music_collection.insert_one(music_doc)
+    search_index.add(music_doc)
+    await media_queue.enqueue(music_doc["_id"], gridfs_file_id)
+    await catalog_cache.bump()
+
+    return {
+        "message": "File uploaded successfully",
+        "file_id": str(gridfs_file_id),
+        "sha256": sha256,
+        "deduplicated": bool(existing),
+    }
 
-    return {"message": "File uploaded successfully", "file_id": str(gridfs_file_id)}
+# Media types for the audio formats accepted by upload_music
+AUDIO_MEDIA_TYPES = {"mp3": "audio/mpeg", "wav": "audio/wav"}
 
-# Route to fetch songs by filename or ID
+def audio_media_type(filename: str) -> str:
+    return AUDIO_MEDIA_TYPES.get((filename or "").rsplit(".", 1)[-1].lower(), "audio/mpeg")
+
+# Stream [start, start + count) from a GridFS file. seek() only moves the read position,
+# so the next read queries chunks from n = start // chunk_size instead of reading from byte 0.
+async def iter_grid_out(grid_out, start: int, count: int):
+    try:
+        grid_out.seek(start)
+        remaining = count
+        while remaining > 0:
+            data = await grid_out.read(min(grid_out.chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        grid_out.close()
+
+# FileResponse for a pinned cache entry; unpins it once the body is sent or the send fails
+class CachedFileResponse(FileResponse):
+    def __init__(self, path: str, release, **kwargs):
+        super().__init__(path, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+# Route to fetch songs by filename or ID (supports HTTP Range requests for seeking)
 @app.get("/api/songs/file/{filename}")
-async def get_song_file(filename: str):
+async def get_song_file(filename: str, request: Request):
     decoded_filename = unquote(filename)
 
     try:
@@ -196,17 +324,175 @@ async def get_song_file(filename: str):
         else:
             # Fetch by filename
             file = await fs.open_download_stream_by_name(decoded_filename)
-
-        # Return file as a stream
-        return StreamingResponse(file, media_type="audio/mpeg")
-    except Exception as e:
-        print(f"Error fetching file: {e}")
+    except NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception:
+        logger.exception("Error fetching file %s", decoded_filename)
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    
-# Get all songs
+
+    length = file.length
+    # GridFS files are immutable, so the file id is a strong validator
+    etag = f'"{file._id}"'
+    last_modified = file.upload_date.replace(tzinfo=timezone.utc)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+    }
+    media_type = audio_media_type(file.filename or decoded_filename)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        file.close()
+        return Response(status_code=304, headers=headers)
+
+    # Serve from the local disk cache when possible; Starlette's FileResponse handles Range there.
+    # A miss is streamed from GridFS below while the cache fills in the background.
+    if audio_cache.enabled:
+        file_id = str(file._id)
+        cached_path = audio_cache.acquire(file_id)
+        if cached_path:
+            file.close()
+            return CachedFileResponse(
+                cached_path, lambda: audio_cache.release(file_id), media_type=media_type, headers=headers
+            )
+        audio_cache.fill_in_background(file_id, length, lambda: fs.open_download_stream(file._id))
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and length > 0:
+        if_range = request.headers.get("if-range")
+        # Only honour Range if the client's cached copy is still current
+        if not if_range or if_range.strip() in (etag, headers["Last-Modified"]):
+            try:
+                byte_range = parse_range_header(range_header, length)
+            except HTTPException:
+                file.close()
+                raise
+
+    if byte_range is None:
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(iter_grid_out(file, 0, length), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_grid_out(file, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
+
+# Audio disk cache counters, for sizing AUDIO_CACHE_MAX_BYTES
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return audio_cache.stats()
+
+@app.on_event("shutdown")
+async def stop_audio_cache():
+    await audio_cache.stop()
+
+# Catalog fields returned by the list endpoint; full comment threads live in comments_collection
+SONG_LIST_PROJECTION = {
+    "filename": 1, "title": 1, "artist": 1, "genre": 1, "likes": 1,
+    "comment_count": 1, "latest_comments": 1,
+    "media.duration": 1, "media.bitrate": 1, "media.sample_rate": 1, "media.channels": 1,
+}
+SONG_PAGE_DEFAULT = 50
+SONG_PAGE_MAX = 200
+COMMENT_PAGE_DEFAULT = 20
+COMMENT_PAGE_MAX = 100
+LATEST_COMMENTS_PREVIEW = 3  # Newest comments kept on the song document
+
+# Ensure indexes used by the catalog and auth queries
+@app.on_event("startup")
+async def ensure_indexes():
+    await music_collection.create_index([("genre", 1), ("_id", 1)])
+    await music_collection.create_index([("artist", 1), ("_id", 1)])
+    try:
+        await users_collection.create_index("username", unique=True)
+    except OperationFailure as e:
+        # Existing duplicate usernames: fall back to a plain index so lookups still use it
+        logger.warning("Could not create unique username index: %s", e)
+        await users_collection.create_index("username")
+    await comments_collection.create_index([("song_id", 1), ("timestamp", -1), ("_id", -1)])
+    await likes_collection.create_index([("user", 1), ("song_id", 1)], unique=True)
+    await db["fs.files"].create_index("sha256")
+
+# Like counter increments are buffered in-process and flushed to music_collection.
+# Flushes don't bump the catalog version; cached pages pick up new counts when they expire.
+like_aggregator = LikeAggregator(music_collection)
+
+@app.on_event("startup")
+async def start_like_aggregator():
+    like_aggregator.start()
+
+@app.on_event("shutdown")
+async def stop_like_aggregator():
+    await like_aggregator.stop()
+
+@app.on_event("shutdown")
+async def stop_password_pool():
+    password_pool.shutdown()
+
+# In-process search index; loaded in the background at startup, then kept in sync by _id
+search_index = SongSearchIndex()
+
+@app.on_event("startup")
+async def start_search_index():
+    search_index.start(music_collection)
+
+@app.on_event("shutdown")
+async def stop_search_index():
+    await search_index.stop()
+
+# Ranked search over title, artist and genre (the last word may be partially typed)
+@app.get("/api/songs/search")
+async def search_songs(q: str = "", limit: int = Query(20, ge=1, le=100)):
+    return {"songs": search_index.search(q, limit)}
+
+# Title/artist/genre suggestions for a typed prefix
+@app.get("/api/songs/autocomplete")
+async def autocomplete_songs(q: str = "", limit: int = Query(10, ge=1, le=50)):
+    return {"suggestions": search_index.autocomplete(q, limit)}
+
+# Get songs, paginated by _id (pass next_cursor back as ?cursor= for the next page).
+# Pages are cached pre-encoded per catalog version and answered with 304 when the ETag matches.
 @app.get("/api/songs")
-async def get_songs():
-    songs_cursor = music_collection.find()  # Remove (100) and fix find() method
+async def get_songs(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(SONG_PAGE_DEFAULT, ge=1, le=SONG_PAGE_MAX),
+    genre: Optional[str] = None,
+    artist: Optional[str] = None,
+):
+    version = await catalog_cache.version()
+    cache_key = (cursor, limit, genre, artist)
+    cached = catalog_cache.get(version, cache_key)
+    if cached is None:
+        cached = catalog_cache.put(version, cache_key, await load_song_page(cursor, limit, genre, artist))
+    body, etag = cached
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def load_song_page(cursor: Optional[str], limit: int, genre: Optional[str], artist: Optional[str]) -> dict:
+    query = {}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+    if genre:
+        query["genre"] = genre
+    if artist:
+        query["artist"] = artist
+
+    # Fetch one extra document to know whether another page exists
+    songs_cursor = music_collection.find(query, SONG_LIST_PROJECTION).sort("_id", 1).limit(limit + 1)
     song_list = []
     async for song in songs_cursor:
         song_list.append({
@@ -216,44 +502,253 @@ async def get_songs():
             "artist": song.get("artist", "Unknown Artist"),
             "genre": song.get("genre", "Unknown Genre"),
             "likes": song.get("likes", 0),  # Include likes if available
-            "comments": song.get("comments", [])  # Include comments if available
+            "comment_count": song.get("comment_count", 0),
+            "latest_comments": [serialize_comment(c) for c in song.get("latest_comments", [])],  # Preview only, see /comments
+            "media": song.get("media"),  # None until the media worker has processed the file
         })
-    return {"songs": song_list}  # Return as a dictionary with "songs" key
 
-# Like a song
+    next_cursor = None
+    if len(song_list) > limit:
+        song_list = song_list[:limit]
+        next_cursor = song_list[-1]["_id"]
+    return {"songs": song_list, "next_cursor": next_cursor}  # Return as a dictionary with "songs" key
+
+# Like a song (each user's like counts once; the counter is written in batches)
 @app.post("/api/songs/{song_id}/like")
-async def like_song(song_id: str):
-    try:
-        result = await db.songs.update_one(
-            {"_id": ObjectId(song_id)},
-            {"$inc": {"likes": 1}}
-        )
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Song not found")
+async def like_song(song_id: str, token: str = Depends(oauth2_scheme)):
+    username = verify_token(token)["sub"]
+    if not ObjectId.is_valid(song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
+    song_oid = ObjectId(song_id)
+    if not await music_collection.find_one({"_id": song_oid}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Song not found")
 
-        return {"message": "Song liked successfully!"}
-    except Exception as e:
-        print(f"Error liking song: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+    try:
+        await likes_collection.insert_one({"user": username, "song_id": song_oid, "timestamp": datetime.utcnow()})
+    except DuplicateKeyError:
+        return {"message": "Song already liked", "liked": True, "changed": False}
+    like_aggregator.add(song_oid, 1)
+    return {"message": "Song liked successfully!", "liked": True, "changed": True}
+
+# Undo a like
+@app.delete("/api/songs/{song_id}/like")
+async def unlike_song(song_id: str, token: str = Depends(oauth2_scheme)):
+    username = verify_token(token)["sub"]
+    if not ObjectId.is_valid(song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
+    song_oid = ObjectId(song_id)
+    result = await likes_collection.delete_one({"user": username, "song_id": song_oid})
+    if result.deleted_count == 0:
+        return {"message": "Song was not liked", "liked": False, "changed": False}
+    like_aggregator.add(song_oid, -1)
+    return {"message": "Like removed", "liked": False, "changed": True}
+
+def serialize_comment(comment: dict) -> dict:
+    return {
+        "_id": str(comment["_id"]),
+        "user": comment.get("user", "Anonymous"),
+        "comment": comment.get("comment", ""),
+        "timestamp": comment.get("timestamp"),
+    }
 
 # Add a comment
 @app.post("/api/songs/{song_id}/comments")
 async def add_comment(song_id: str, comment: CommentRequest):
+    if not ObjectId.is_valid(song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
     comment_data = {
+        "_id": ObjectId(),
+        "song_id": ObjectId(song_id),
         "user": comment.user,
         "comment": comment.comment,
         "timestamp": datetime.utcnow()
     }
-    result = await db["music"].update_one(
-        {"_id": ObjectId(song_id)},
-        {"$push": {"comments": comment_data}}
+    # Insert first so the song's count and preview never reference a comment that doesn't exist
+    await comments_collection.insert_one(comment_data)
+    # Keep only the count and a short preview on the song so the document stays small
+    preview = {k: comment_data[k] for k in ("_id", "user", "comment", "timestamp")}
+    result = await music_collection.update_one(
+        {"_id": comment_data["song_id"]},
+        {
+            "$inc": {"comment_count": 1},
+            "$push": {"latest_comments": {"$each": [preview], "$slice": -LATEST_COMMENTS_PREVIEW}},
+        }
+    )
+    if result.matched_count == 0:
+        await comments_collection.delete_one({"_id": comment_data["_id"]})
+        raise HTTPException(status_code=404, detail="Song not found")
+    await catalog_cache.bump()
+    return {"message": "Comment added", "comment_id": str(comment_data["_id"])}
+
+# Get comments for a song, newest first (pass next_cursor back as ?cursor= for older comments)
+@app.get("/api/songs/{song_id}/comments")
+async def get_comments(
+    song_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(COMMENT_PAGE_DEFAULT, ge=1, le=COMMENT_PAGE_MAX),
+):
+    if not ObjectId.is_valid(song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
+    query = {"song_id": ObjectId(song_id)}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        last = await comments_collection.find_one({"_id": ObjectId(cursor)}, {"timestamp": 1})
+        if not last:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"timestamp": {"$lt": last["timestamp"]}},
+            {"timestamp": last["timestamp"], "_id": {"$lt": last["_id"]}},
+        ]
+
+    comments_cursor = comments_collection.find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1)
+    comment_list = [serialize_comment(c) async for c in comments_cursor]
+
+    next_cursor = None
+    if len(comment_list) > limit:
+        comment_list = comment_list[:limit]
+        next_cursor = comment_list[-1]["_id"]
+    return {"comments": comment_list, "next_cursor": next_cursor}
+
+# Move comments embedded in music documents into comments_collection.
+# Safe to re-run: previously migrated copies for a song are replaced before inserting.
+async def migrate_embedded_comments(batch_size: int = 500):
+    migrated_songs = 0
+    migrated_comments = 0
+    songs_cursor = music_collection.find(
+        {"comments": {"$exists": True}}, {"comments": 1}
+    ).batch_size(50)
+    async for song in songs_cursor:
+        embedded = song.get("comments") or []
+        await comments_collection.delete_many({"song_id": song["_id"], "migrated": True})
+        docs = [
+            {
+                "_id": ObjectId(),
+                "song_id": song["_id"],
+                "user": c.get("user", "Anonymous"),
+                "comment": c.get("comment", ""),
+                "timestamp": c.get("timestamp") or song["_id"].generation_time.replace(tzinfo=None),
+                "migrated": True,
+            }
+            for c in embedded
+        ]
+        for i in range(0, len(docs), batch_size):
+            await comments_collection.insert_many(docs[i:i + batch_size], ordered=False)
+        # Embedded comments are older than any added through the new endpoint, so prepend them.
+        # The preview reuses the inserted ids so it points at the same comment documents.
+        preview = [
+            {"_id": d["_id"], "user": d["user"], "comment": d["comment"], "timestamp": d["timestamp"]}
+            for d in docs[-LATEST_COMMENTS_PREVIEW:]
+        ]
+        await music_collection.update_one(
+            {"_id": song["_id"]},
+            {
+                "$unset": {"comments": ""},
+                "$inc": {"comment_count": len(embedded)},
+                "$push": {"latest_comments": {
+                    "$each": preview, "$position": 0, "$slice": -LATEST_COMMENTS_PREVIEW,
+                }},
+            }
+        )
+        migrated_songs += 1
+        migrated_comments += len(embedded)
+    return {"songs": migrated_songs, "comments": migrated_comments}
+
+async def read_gridfs_file(file_id) -> bytes:
+    grid_out = await fs.open_download_stream(file_id)
+    try:
+        return await grid_out.read()
+    finally:
+        grid_out.close()
+
+# Store analysis results on the song; the peaks are kept as raw bytes for the binary endpoint
+async def save_media_result(song_id, result: dict):
+    peaks = result.pop("peaks", b"")
+    await music_collection.update_one(
+        {"_id": song_id},
+        {"$set": {"media": result, "waveform_peaks": peaks}},
+    )
+    await catalog_cache.bump()
+
+# Post-upload analysis (duration, bitrate, waveform peaks, MP3 seek table), queued in Mongo
+media_queue = MediaJobQueue(media_jobs_collection, read_gridfs_file, save_media_result)
+
+@app.on_event("startup")
+async def start_media_queue():
+    await media_queue.ensure_indexes()
+    media_queue.start()
+
+@app.on_event("shutdown")
+async def stop_media_queue():
+    await media_queue.stop()
+
+# Waveform peaks as raw uint8 bytes, one per bucket (0-255, normalised to the song's loudest bucket)
+@app.get("/api/songs/{song_id}/peaks")
+async def get_song_peaks(song_id: str):
+    if not ObjectId.is_valid(song_id):
+        raise HTTPException(status_code=404, detail="Song not found")
+    song = await music_collection.find_one({"_id": ObjectId(song_id)}, {"waveform_peaks": 1})
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    peaks = song.get("waveform_peaks")
+    if not peaks:
+        raise HTTPException(status_code=404, detail="Waveform not available yet")
+    return Response(
+        content=bytes(peaks),
+        media_type="application/octet-stream",
+        headers={"Cache-Control": "public, max-age=86400", "X-Peak-Count": str(len(peaks))},
     )
-    if result.modified_count == 1:
-        return {"message": "Comment added"}
-    raise HTTPException(status_code=404, detail="Song not found")
+
+# Queue media analysis for songs that don't have it yet
+async def backfill_media(process: bool = False):
+    await media_queue.ensure_indexes()
+    queued = 0
+    async for song in music_collection.find({"media": {"$exists": False}, "file_id": {"$exists": True}}, {"file_id": 1}):
+        # Songs whose analysis previously gave up get a fresh set of attempts
+        await media_queue.enqueue(song["_id"], song["file_id"], retry_failed=True)
+        queued += 1
+    processed = await media_queue.drain() if process else 0
+    return {"queued": queued, "processed": processed}
+
+# Cache, like buffer and search index metrics alongside the request/Mongo metrics;
+# cumulative cache stats are counters, the rest are gauges
+AUDIO_CACHE_COUNTERS = ("hits", "misses", "evictions", "fill_errors")
+CATALOG_CACHE_COUNTERS = ("hits", "misses")
+metrics.collectors.append(lambda: {f"audio_cache_{k}": v for k, v in audio_cache.stats().items() if k not in AUDIO_CACHE_COUNTERS})
+metrics.counter_collectors.append(lambda: {f"audio_cache_{k}": v for k, v in audio_cache.stats().items() if k in AUDIO_CACHE_COUNTERS})
+metrics.collectors.append(lambda: {"likes_pending_songs": len(like_aggregator.pending)})
+metrics.collectors.append(lambda: {"search_index_songs": len(search_index)})
+metrics.collectors.append(lambda: {f"catalog_cache_{k}": v for k, v in catalog_cache.stats().items() if k not in CATALOG_CACHE_COUNTERS})
+metrics.counter_collectors.append(lambda: {f"catalog_cache_{k}": v for k, v in catalog_cache.stats().items() if k in CATALOG_CACHE_COUNTERS})
+
+@app.on_event("shutdown")
+async def stop_profiler():
+    if profiler is not None:
+        profiler.stop()
+
+# Prometheus-style metrics for this worker process
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Root endpoint
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the FastAPI backend!"}
-  
\ No newline at end of file
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Music Hub maintenance commands")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subcommands.add_parser("migrate-comments", help="Move embedded song comments to the comments collection")
+    migrate_parser.add_argument("--batch-size", type=int, default=500)
+    backfill_parser = subcommands.add_parser("backfill-media", help="Queue media analysis for songs that lack it")
+    backfill_parser.add_argument("--process", action="store_true", help="Also run the queued jobs in this process")
+    args = parser.parse_args()
+
+    if args.command == "migrate-comments":
+        print(asyncio.run(migrate_embedded_comments(args.batch_size)))
+    elif args.command == "backfill-media":
+        print(asyncio.run(backfill_media(args.process)))
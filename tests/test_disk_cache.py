@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+from backend.disk_cache import AudioDiskCache
+
+
+class FakeGridOut:
+    def __init__(self, data: bytes):
+        self.chunks = [data]
+
+    async def readchunk(self):
+        return self.chunks.pop() if self.chunks else b""
+
+    def close(self):
+        pass
+
+
+def fill(cache, file_id, size):
+    async def run():
+        async def open_stream():
+            return FakeGridOut(b"x" * size)
+
+        cache.fill_in_background(file_id, size, open_stream)
+        await asyncio.gather(*cache.inflight.values())
+
+    asyncio.run(run())
+
+
+def test_pinned_file_survives_eviction_until_released(tmp_path):
+    cache = AudioDiskCache(str(tmp_path), max_bytes=1500)
+    fill(cache, "a", 1000)
+    path = cache.acquire("a")
+    fill(cache, "b", 1000)  # Over budget, but "a" is being served
+    assert os.path.exists(path)
+    cache.release("a")
+    assert not os.path.exists(path)
+    assert cache.stats()["bytes"] == 1000
+
+
+def test_miss_then_hit(tmp_path):
+    cache = AudioDiskCache(str(tmp_path), max_bytes=10_000)
+    assert cache.acquire("a") is None
+    fill(cache, "a", 100)
+    assert cache.acquire("a") == os.path.join(str(tmp_path), "a")
+    cache.release("a")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_load_keeps_partial_files_of_live_processes(tmp_path):
+    live = tmp_path / f"a.{os.getpid()}.part"
+    stale = tmp_path / "b.999999999.part"
+    live.write_bytes(b"x")
+    stale.write_bytes(b"x")
+    (tmp_path / "c").write_bytes(b"x" * 10)
+    cache = AudioDiskCache(str(tmp_path), max_bytes=1000)
+    assert live.exists()
+    assert not stale.exists()
+    assert list(cache.entries) == ["c"]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from backend.likes import LikeAggregator
+
+
+# Applies UpdateOne ops the way MongoDB would, optionally after a delay
+class FakeCollection:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.docs = {}
+
+    async def bulk_write(self, ops, ordered=True):
+        async def apply():
+            await asyncio.sleep(self.delay)
+            for op in ops:
+                query, update = op._filter, op._doc
+                doc = self.docs.setdefault(query["_id"], {"likes": 0, "like_batches": []})
+                if query["like_batches"]["$ne"] in doc["like_batches"]:
+                    continue
+                doc["likes"] += update["$inc"]["likes"]
+                doc["like_batches"] += update["$push"]["like_batches"]["$each"]
+
+        # Like Motor's thread pool: cancelling the caller doesn't cancel the write
+        await asyncio.shield(asyncio.ensure_future(apply()))
+
+    def likes(self, song_id):
+        return self.docs.get(song_id, {}).get("likes", 0)
+
+
+def test_flush_writes_buffered_increments():
+    async def run():
+        collection = FakeCollection()
+        aggregator = LikeAggregator(collection)
+        aggregator.add("a", 1)
+        aggregator.add("a", 1)
+        aggregator.add("b", -1)
+        assert await aggregator.flush() == 2
+        return collection
+
+    collection = asyncio.run(run())
+    assert collection.likes("a") == 2
+    assert collection.likes("b") == -1
+
+
+def test_timed_out_write_is_applied_once():
+    async def run():
+        collection = FakeCollection(delay=0.2)
+        aggregator = LikeAggregator(collection, flush_timeout=0.05)
+        aggregator.add("a", 5)
+        assert await aggregator.flush() == 0  # Times out, but the write still lands
+        await asyncio.sleep(0.3)
+        collection.delay = 0.0
+        aggregator.add("a", 2)
+        await aggregator.flush()
+        return collection
+
+    assert asyncio.run(run()).likes("a") == 7
+
+
+def test_stop_during_flush_keeps_the_batch():
+    async def run():
+        collection = FakeCollection(delay=0.2)
+        aggregator = LikeAggregator(collection, flush_interval=0.01)
+        aggregator.start()
+        aggregator.add("a", 1)
+        await asyncio.sleep(0.05)  # The periodic flush is now waiting on bulk_write
+        await aggregator.stop()
+        return collection, aggregator
+
+    collection, aggregator = asyncio.run(run())
+    assert collection.likes("a") == 1
+    assert aggregator._failed is None and not aggregator.pending
@@ -0,0 +1,99 @@
+import struct
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pymongo")
+
+from backend.media import analyse_audio, analyse_mp3, analyse_wav
+
+# MPEG-1 Layer III, no CRC, 128 kbps, 44.1 kHz, stereo: 417-byte frames of 1152 samples
+MP3_HEADER = b"\xff\xfb\x90\x00"
+MP3_FRAME_BYTES = 417
+
+
+def mp3_frame(global_gain=None) -> bytes:
+    # Side info is 32 bytes for MPEG-1 stereo; granule 0 / channel 0 starts after 20 bits
+    bits = 0
+    if global_gain is not None:
+        total, offset = 32 * 8, 20
+        bits |= 1 << (total - offset - 12)  # part2_3_length = 1
+        bits |= global_gain << (total - offset - 29)
+    frame = MP3_HEADER + bits.to_bytes(32, "big")
+    return frame + bytes(MP3_FRAME_BYTES - len(frame))
+
+
+def id3_tag(size: int) -> bytes:
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x04\x00\x00" + syncsafe + bytes(size)
+
+
+def wav_file(samples, sample_rate=8000, extra_chunk=b"") -> bytes:
+    pcm = struct.pack(f"<{len(samples)}h", *samples)
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    if extra_chunk:
+        chunks += b"LIST" + struct.pack("<I", len(extra_chunk)) + extra_chunk + b"\x00" * (len(extra_chunk) & 1)
+    chunks += b"data" + struct.pack("<I", len(pcm)) + pcm
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def test_analyse_mp3_constant_bitrate():
+    frames = 100
+    data = id3_tag(100) + mp3_frame() * frames
+    result = analyse_mp3(data)
+    assert result["frames"] == frames
+    assert result["sample_rate"] == 44100
+    assert result["channels"] == 2
+    assert result["duration"] == round(frames * 1152 / 44100, 3)
+    assert abs(result["bitrate"] - 128000) < 500
+    assert result["seek_table"][0] == [0.0, 110]  # First frame follows the 10-byte header + tag
+    assert result["seek_table"][1] == [1.0, 110 + 38 * MP3_FRAME_BYTES]  # Frame 38 plays from 0.9927 s
+
+
+def test_analyse_mp3_peaks_follow_global_gain():
+    # global_gain 210 decodes at unit scale, 202 at a quarter of it
+    data = mp3_frame(210) + mp3_frame(202) * 3 + mp3_frame()
+    result = analyse_mp3(data)
+    assert list(result["peaks"]) == [255, 64, 64, 64, 0]
+
+
+def test_analyse_mp3_resyncs_after_garbage():
+    data = mp3_frame() * 3 + b"\x00\xff\x00" * 10 + mp3_frame() * 3
+    assert analyse_mp3(data)["frames"] == 6
+
+
+def test_analyse_mp3_rejects_non_audio():
+    with pytest.raises(ValueError):
+        analyse_mp3(bytes(4096))
+
+
+def test_analyse_wav():
+    samples = [0] * 8000
+    samples[4000] = -32768
+    samples[100] = 16384
+    data = wav_file(samples, extra_chunk=b"INFOabc")  # Odd-sized chunk is padded to even
+    result = analyse_wav(data)
+    assert result["duration"] == 1.0
+    assert result["sample_rate"] == 8000
+    assert result["channels"] == 1
+    assert result["bitrate"] == 128000
+    assert result["bits_per_sample"] == 16
+    assert result["data_offset"] == len(data) - 16000
+    assert len(result["peaks"]) == 1000
+    assert max(result["peaks"]) == 255
+    assert result["peaks"][500] == 255
+    assert result["peaks"][12] == 128
+
+
+def test_analyse_wav_with_streamed_size():
+    data = bytearray(wav_file([1000, -1000] * 400))
+    data[40:44] = b"\xff\xff\xff\xff"  # Writers that stream leave the data size unset
+    assert analyse_wav(bytes(data))["duration"] == 0.1
+
+
+def test_analyse_audio_dispatches_on_content():
+    assert analyse_audio(wav_file([0] * 80))["format"] == "wav"
+    assert analyse_audio(mp3_frame() * 4)["format"] == "mp3"
+    with pytest.raises(ValueError):
+        analyse_audio(b"not audio at all")
@@ -0,0 +1,52 @@
+import heapq
+import operator
+
+import pytest
+
+pytest.importorskip("bson")
+
+from backend.search import MAX_PREFIX_EXPANSIONS, TERM_TOP_ENTRIES, SongSearchIndex
+
+
+def song(i, title, artist="Someone", genre="Pop"):
+    return {"_id": f"{i:024x}", "title": title, "artist": artist, "genre": genre}
+
+
+def test_prefix_expansion_prefers_frequent_terms():
+    index = SongSearchIndex()
+    # More rare "h..." terms than MAX_PREFIX_EXPANSIONS, all sorting before "hop"
+    index.add_many([song(i, f"ha{i:03d}") for i in range(MAX_PREFIX_EXPANSIONS + 10)])
+    index.add_many([song(1000 + i, f"Track {i}", genre="Hip Hop") for i in range(30)])
+    assert "hop" in index._expand_prefix("h")
+    assert len(index.search("hip h", 100)) == 30
+
+
+def test_single_word_prefix_ranks_best_matches():
+    index = SongSearchIndex()
+    index.add_many([song(i, f"Love Song {i}", genre="Rock") for i in range(300)])
+    index.add(song(999, "Lovely Love", artist="Love Band"))
+    results = index.search("lo", 5)
+    assert results[0]["_id"] == f"{999:024x}"
+    assert len(results) == 5
+
+
+def test_top_entries_match_full_ranking_after_incremental_adds():
+    index = SongSearchIndex()
+    index.add_many([song(i, "Night", genre="Rock") for i in range(TERM_TOP_ENTRIES + 50)])
+    for i in range(20):
+        index.add(song(500 + i, "Night Night", artist="Night"))
+    expected = heapq.nlargest(TERM_TOP_ENTRIES, index.postings["night"].items(), key=operator.itemgetter(1))
+    top = list(index._top_entries("night"))
+    assert [weight for _, weight in top] == [weight for _, weight in expected]
+    assert {song_id for song_id, _ in top[:20]} == {f"{500 + i:024x}" for i in range(20)}
+
+
+def test_multi_word_query_intersects_with_partial_last_word():
+    index = SongSearchIndex()
+    index.add_many([
+        song(1, "Blue Moon", genre="Jazz"),
+        song(2, "Blue Monday", genre="Rock"),
+        song(3, "Red Moon", genre="Jazz"),
+    ])
+    assert {r["_id"] for r in index.search("blue mo")} == {f"{1:024x}", f"{2:024x}"}
+    assert {r["_id"] for r in index.search("moon ja")} == {f"{1:024x}", f"{3:024x}"}
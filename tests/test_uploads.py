@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("python_multipart")
+
+from fastapi import HTTPException
+
+from backend.uploads import MAX_FORM_BYTES, MAX_FORM_PARTS, iter_multipart, sniff_audio_format
+
+BOUNDARY = "testboundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def form_body(fields, file=None) -> bytes:
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    if file is not None:
+        filename, data = file
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def collect(body: bytes, chunk_size: int = 7, content_type: str = CONTENT_TYPE) -> list:
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    async def run():
+        return [event async for event in iter_multipart(chunks(), content_type)]
+
+    return asyncio.run(run())
+
+
+def test_fields_and_file_across_chunk_boundaries():
+    payload = bytes(range(256)) * 20
+    events = collect(form_body([("title", "Song"), ("artist", "Band")], ("song.mp3", payload)))
+    assert events[0] == ("field", "title", "Song")
+    assert events[1] == ("field", "artist", "Band")
+    assert events[2] == ("file_start", "file", "song.mp3")
+    assert events[-1] == ("file_end",)
+    assert b"".join(e[1] for e in events if e[0] == "file_data") == payload
+
+
+def test_rejects_truncated_body():
+    body = form_body([("title", "Song")], ("song.mp3", b"\xff\xfb" + bytes(4096)))
+    seen = []
+
+    async def run():
+        async def chunks():
+            yield body[:2000]
+
+        async for event in iter_multipart(chunks(), CONTENT_TYPE):
+            seen.append(event[0])
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 400
+    assert "file_end" not in seen
+
+
+def test_rejects_non_multipart():
+    with pytest.raises(HTTPException) as exc:
+        collect(b"{}", content_type="application/json")
+    assert exc.value.status_code == 400
+
+
+def test_caps_part_count():
+    fields = [(f"f{i}", "x") for i in range(MAX_FORM_PARTS + 1)]
+    with pytest.raises(HTTPException) as exc:
+        collect(form_body(fields), chunk_size=4096)
+    assert exc.value.status_code == 413
+
+
+def test_caps_total_field_bytes():
+    # Each field is small, but together they exceed the form budget
+    per_field = MAX_FORM_BYTES // 4
+    fields = [(f"f{i}", "x" * per_field) for i in range(5)]
+    with pytest.raises(HTTPException) as exc:
+        collect(form_body(fields), chunk_size=4096)
+    assert exc.value.status_code == 413
+
+
+def test_file_data_does_not_count_against_form_budget():
+    payload = b"\xff\xfb" + bytes(MAX_FORM_BYTES * 2)
+    events = collect(form_body([("title", "Song")], ("song.mp3", payload)), chunk_size=8192)
+    assert b"".join(e[1] for e in events if e[0] == "file_data") == payload
+
+
+@pytest.mark.parametrize("head, expected", [
+    (b"RIFF\x00\x00\x00\x00WAVEfmt ", "wav"),
+    (b"ID3\x04\x00\x00\x00\x00\x00\x00\x00\x00", "mp3"),
+    (b"\xff\xfb\x90\x00" + bytes(8), "mp3"),
+    (b"\xff\xf9\x90\x00" + bytes(8), None),  # Reserved layer
+    (b"<html><body>", None),
+])
+def test_sniff_audio_format(head, expected):
+    assert sniff_audio_format(head) == expected